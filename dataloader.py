@@ -1,7 +1,13 @@
+import os
+
 import numpy as np
 import pandas as pd
 from torch.utils.data import Dataset
 
+# Bump whenever the training windowing below changes so stale caches are ignored
+WINDOW_CACHE_VERSION = 1
+WINDOW_CACHE_DIR = "./preprocessed_data/cache/"
+
 
 class TimeSeriesDataset(Dataset):
     def __init__(self, config, mode):
@@ -25,6 +31,16 @@ class TimeSeriesDataset(Dataset):
 
     def load_dataset(self, config):
         if self.mode == 'train':
+            csv_path = "./preprocessed_data/train_{:03d}.csv".format(self.config['dataset'])
+            cache_path = os.path.join(WINDOW_CACHE_DIR, "train_{:03d}_lwin_{}_v{}.npz".format(
+                self.config['dataset'], self.config['l_win'], WINDOW_CACHE_VERSION))
+            # Reuse windows from an earlier run unless the preprocessed csv is newer
+            if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+                with np.load(cache_path) as cached:
+                    self.data = cached['data']
+                    self.label = cached['label']
+                return
+
             if self.config['dataset'] == 1:
                 train_df = pd.read_csv("./preprocessed_data/train_001.csv")
                 #FD001
@@ -152,6 +168,13 @@ class TimeSeriesDataset(Dataset):
             self.data = seq_array
             self.label = label_array
 
+            # Write to a temp file first so concurrent runs never read a partial cache
+            os.makedirs(WINDOW_CACHE_DIR, exist_ok=True)
+            tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, data=seq_array, label=label_array)
+            os.replace(tmp_path, cache_path)
+
         else:
             if self.config['dataset'] == 1:
                 test_df = pd.read_csv("./preprocessed_data/test_001.csv")
@@ -24,7 +24,6 @@ def load_model(config):
             model = create_transformer_kernel_even(N=config['num_layers'],
                                             d_model=config['d_model'],
                                             l_win=config['l_win'],
-                                            device=None,
                                             kernel_size=config['kernel_size'],
                                             d_ff=config['dff'],
                                             h=config['n_head'],
@@ -34,7 +33,6 @@ def load_model(config):
             model = create_transformer_kernel_odd(N=config['num_layers'],
                                             d_model=config['d_model'],
                                             l_win=config['l_win'],
-                                            device=None,
                                             kernel_size=config['kernel_size'],
                                             d_ff=config['dff'],
                                             h=config['n_head'],
@@ -45,7 +43,6 @@ def load_model(config):
             model = create_fnet_hybrid_kernel_even(N=config['num_layers'],
                                             d_model=config['d_model'],
                                             l_win=config['l_win'],
-                                            device=None,
                                             kernel_size=config['kernel_size'],
                                             d_ff=config['dff'],
                                             h=config['n_head'],
@@ -55,7 +52,6 @@ def load_model(config):
             model = create_fnet_hybrid_kernel_odd(N=config['num_layers'],
                                             d_model=config['d_model'],
                                             l_win=config['l_win'],
-                                            device=None,
                                             kernel_size=config['kernel_size'],
                                             d_ff=config['dff'],
                                             h=config['n_head'],
@@ -99,7 +95,8 @@ def main():
     
     with torch.no_grad():
         for x, rul in test_loader:
-            out = model(x.to(device).float())
+            # RUL cannot be negative; the model itself is trained unconstrained
+            out = model(x.to(device).float()).clamp(min=0)
             loss = torch.sqrt(criterion(out.float(), rul.to(device).float()))
             test_loss += loss.item()
             test_loss_list.append(loss.item())
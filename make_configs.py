@@ -1,7 +1,13 @@
+import math
 import os
 import yaml
 import itertools
 
+# libyaml-backed emitter when available, pure-Python otherwise
+Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+# Floats go into filenames with "_" in place of the decimal point
+_TT = str.maketrans({".": "_"})
+
 
 def main():
     params = {
@@ -18,52 +24,48 @@ def main():
         "kernel_size": [3, 4, 5, 6, 7, 8],
     }
 
+    base = {
+        ##FD001
+        # "dataset": 1,
+        # "d_model": 16, 
+        ##FD002 
+        # "dataset": 2,
+        # "d_model": 23, 
+        #FD003
+        # "dataset": 3,
+        # "d_model": 18, 
+        # ##FD004 
+        "dataset": 4,
+        "d_model": 23, 
+        #   1 denote Transformer
+        # "model": 1, 
+        # 2 denote hybrid model 
+        "model": 2 
+    }
+
     keys, values = zip(*params.items())
-    combs = [dict(zip(keys, v)) for v in itertools.product(*values)]
+    n_head_idx = keys.index("n_head")
 
-    print(f"GENERATING {len(combs)} NEW CONFIGS ...")
+    print(f"GENERATING UP TO {math.prod(len(v) for v in values)} NEW CONFIGS ...")
 
-    for comb in combs:
-        filename = "{}stacks_{}nhead_{}lwin_{}lr_{}dff_{}batch_{}epcs_{}dropout_{}kernelsize".format(
-            comb["num_layers"],
-            comb["n_head"],
-            comb["l_win"],
-            comb["lr"],
-            comb['dff'],
-            comb["batch_size"],
-            comb["n_epochs"],
-            comb['dropout'],
-            comb["kernel_size"]
-        ).replace(".", "_")
-        config_path = os.path.join("configs/", "{}.yml".format(filename))
-        config = {
-            "experiment": filename,
-            ##FD001
-            # "dataset": 1,
-            # "d_model": 16, 
-            ##FD002 
-            # "dataset": 2,
-            # "d_model": 23, 
-            #FD003
-            # "dataset": 3,
-            # "d_model": 18, 
-            # ##FD004 
-            "dataset": 4,
-            "d_model": 23, 
-            #   1 denote Transformer
-	        # "model": 1, 
-            # 2 denote hybrid model 
-	        "model": 2 
-        }
-        config.update(comb)
-        
+    # Stream the grid: illegal points are pruned before any dict is built
+    for v in itertools.product(*values):
         #check if config legit
-        for val in params["n_head"]:
-            assert(config['d_model'] % val == 0)
-            
+        if base['d_model'] % v[n_head_idx] != 0:
+            continue
+
+        comb = dict(zip(keys, v))
+        lr = str(comb["lr"]).translate(_TT)
+        dropout = str(comb["dropout"]).translate(_TT)
+        filename = (f"{comb['num_layers']}stacks_{comb['n_head']}nhead_{comb['l_win']}lwin_{lr}lr_"
+                    f"{comb['dff']}dff_{comb['batch_size']}batch_{comb['n_epochs']}epcs_{dropout}dropout_"
+                    f"{comb['kernel_size']}kernelsize")
+        config_path = os.path.join("configs/", "{}.yml".format(filename))
+        config = {"experiment": filename, **base, **comb}
+
         print(filename)
         with open(config_path, "w", encoding="utf-8") as f:
-            yaml.dump(config, f, default_flow_style=False)
+            yaml.dump(config, f, Dumper=Dumper, default_flow_style=False)
 
     print("DONE.")
 
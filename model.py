@@ -1,10 +1,8 @@
-import copy
 import math
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.autograd import Variable
 from torch.nn.modules.normalization import LayerNorm
 
 
@@ -17,15 +15,38 @@ class ConvLayer(nn.Module):
 
     def __init__(self, n_features, kernel_size):
         super().__init__()
-        self.padding = nn.ConstantPad1d((kernel_size - 1) // 2, 0.0)
-        self.conv = nn.Conv1d(in_channels=n_features, out_channels=n_features, kernel_size=kernel_size)
+        # Run as a (1, k) Conv2d so cuDNN can use its NHWC (channels_last) kernels
+        self.conv = nn.Conv2d(in_channels=n_features, out_channels=n_features, kernel_size=(1, kernel_size),
+                              padding=(0, (kernel_size - 1) // 2), padding_mode='zeros')
         self.relu = nn.ReLU()
- 
+        self.conv.to(memory_format=torch.channels_last)
+
     def forward(self, src):
-        src = src.permute(0, 2, 1)
-        src = self.padding(src)
+        # (B, L, C) viewed as (B, C, 1, L) is already channels_last, so no copy is made
+        src = src.permute(0, 2, 1).unsqueeze(2).contiguous(memory_format=torch.channels_last)
         src = self.relu(self.conv(src))
-        return src.permute(0, 2, 1)  # Permute back
+        return src.squeeze(2).permute(0, 2, 1)  # Permute back
+
+
+class FinalHead(nn.Module):
+    """Regression head mapping the whole encoded window to a single RUL value
+    :param seq_len: length of the encoded sequence
+    :param d_model: number of features per time step
+    :param dropout: dropout applied to the encoded sequence
+    """
+
+    def __init__(self, seq_len, d_model, dropout):
+        super().__init__()
+        # W is filled by init_weights(); the bias uses nn.Linear's default range
+        self.W = nn.Parameter(torch.empty(1, seq_len, d_model))
+        bound = 1 / math.sqrt(seq_len * d_model)
+        self.b = nn.Parameter(torch.empty(1).uniform_(-bound, bound))
+        self.p = dropout
+
+    def forward(self, x):
+        # Same as Flatten -> Linear(seq_len * d_model, 1), without the reshape
+        x = F.dropout(x, p=self.p, training=self.training)
+        return torch.einsum("bld,old->bo", x, self.W) + self.b
 
 
 class TransformerModel(nn.Module):
@@ -36,32 +57,25 @@ class TransformerModel(nn.Module):
         self.linear = linear
         self.conv = conv
 
-    def forward(self, src, src_mask=None):
+    def forward(self, src):
         src = self.conv(src)
-        output = F.relu(self.linear(
-            self.encoder(self.src_embed(src), src_mask)))
+        output = self.linear(
+            self.encoder(self.src_embed(src)))
         return output
 
 
-def clones(module, N):
-    """
-    Produce N identical layers
-    """
-    return nn.ModuleList([copy.deepcopy(module) for _ in range(N)])
-
-
 class TransformerEncoder(nn.Module):
-    "Core encoder is a stack of N layers"
+    "Core encoder is a stack of N layers, each freshly built by layer_fn"
 
-    def __init__(self, layer, N):
+    def __init__(self, layer_fn, N, size):
         super().__init__()
-        self.layers = clones(layer, N)
-        self.norm = LayerNorm(layer.size)
+        self.layers = nn.ModuleList([layer_fn() for _ in range(N)])
+        self.norm = LayerNorm(size)
 
-    def forward(self, x, mask):
-        "Pass the input (and mask) through each layer in turn"
+    def forward(self, x):
+        "Pass the input through each layer in turn"
         for layer in self.layers:
-            x = layer(x, mask)
+            x = layer(x)
         return self.norm(x)
 
 
@@ -80,6 +94,8 @@ class SublayerConnection(nn.Module):
         """
         Apply residual connection to any sublayer with the same size.
         """
+        # LayerNorm, dropout and the residual add are fused by the whole-model
+        # compile in train.py, so they stay as plain eager ops here
         return x + self.dropout(sublayer(self.norm(x)))
 
 
@@ -92,31 +108,25 @@ class TransformerEncoderLayer(nn.Module):
         super().__init__()
         self.self_attn = self_attn
         self.feed_forward = feed_forward
-        self.sublayer = clones(SublayerConnection(size, dropout), 2)
+        self.sublayer = nn.ModuleList([SublayerConnection(size, dropout) for _ in range(2)])
         self.size = size
 
-    def forward(self, x, mask=None):
-        x = self.sublayer[0](x, lambda x: self.self_attn(x, x, x, mask))
+    def forward(self, x):
+        # RUL regression is non-autoregressive, so no attention mask is needed
+        x = self.sublayer[0](x, lambda x: self.self_attn(x, x, x))
         return self.sublayer[1](x, self.feed_forward)
 
 
-def attention(query, key, value, device, mask=None, dropout=0.0):
-    """Compute the Scaled Dot-Product Attention"""
-    query = query.to(device)
-    key = query.to(device)
-    value = query.to(device)
-    d_k = query.size(-1)
-    scores = torch.matmul(query, key.transpose(-2, -1)) / math.sqrt(d_k)
+def attention(query, key, value, mask=None, dropout=0.0):
+    """Compute the Scaled Dot-Product Attention (fused kernel)"""
     if mask is not None:
-        mask = mask.to(device)
-        scores = scores.masked_fill(mask == 0, -1e9)
-    p_attn = F.softmax(scores, dim=-1)
-    p_attn = F.dropout(p_attn, p=dropout)
-    return torch.matmul(p_attn, value), p_attn
+        # SDPA takes a boolean mask where True means "attend".
+        mask = mask.bool()
+    return F.scaled_dot_product_attention(query, key, value, attn_mask=mask, dropout_p=dropout)
 
 
 class MultiHeadAttention(nn.Module):
-    def __init__(self, h, d_model, device, dropout=0.1):
+    def __init__(self, h, d_model, dropout=0.1):
         """
         Takes in model size and number of heads.
         """
@@ -125,9 +135,8 @@ class MultiHeadAttention(nn.Module):
         self.d_k = d_model // h
         self.h = h
         self.p = dropout
-        self.linears = clones(nn.Linear(d_model, d_model), 4)
-        self.attn = None
-        self.device = device
+        self.qkv = nn.Linear(d_model, 3 * d_model)
+        self.out = nn.Linear(d_model, d_model)
 
     def forward(self, query, key, value, mask=None):
         if mask is not None:
@@ -135,14 +144,22 @@ class MultiHeadAttention(nn.Module):
             mask = mask.unsqueeze(1)
         nbatches = query.size(0)
         # 1) Do all the linear projections in batch from d_model => h x d_k
-        query, key, value = [l(x).view(nbatches, -1, self.h, self.d_k).transpose(1, 2)
-                             for l, x in zip(self.linears, (query, key, value))]
+        if query is key and key is value:
+            # Self-attention: one packed GEMM, then split into q, k, v
+            qkv = self.qkv(query).view(nbatches, -1, 3, self.h, self.d_k).permute(2, 0, 3, 1, 4)
+            query, key, value = qkv.unbind(0)
+        else:
+            w_q, w_k, w_v = self.qkv.weight.chunk(3)
+            b_q, b_k, b_v = self.qkv.bias.chunk(3)
+            query, key, value = [F.linear(x, w, b).view(nbatches, -1, self.h, self.d_k).transpose(1, 2)
+                                 for x, w, b in zip((query, key, value), (w_q, w_k, w_v), (b_q, b_k, b_v))]
         # 2) Apply attention on all the projected vectors in batch
-        x, self.attn = attention(query, key, value, self.device, mask=mask, dropout=self.p)
+        x = attention(query, key, value, mask=mask,
+                      dropout=self.p if self.training else 0.0)
         # 3) "Concat" using a view and apply a final linear
         x = x.transpose(1, 2).contiguous().view(
             nbatches, -1, self.h * self.d_k)
-        return self.linears[-1](x)
+        return self.out(x)
 
 
 class PositionwiseFeedForward(nn.Module):
@@ -172,19 +189,14 @@ class PositionalEncoding(nn.Module):
                              * (-math.log(10000.0) / d_model))
 
         pe[:, 0::2] = torch.sin(position * div_term)
-        try:
-            pe[:, 1::2] = torch.cos(position * div_term)
-        except:
-            div_term = torch.exp(torch.arange(0, d_model - 1, 2)
-                                 * (-math.log(10000.0) / d_model))
-            pe[:, 1::2] = torch.cos(position * div_term)
+        # With an odd d_model there is one fewer cosine column than sine column
+        pe[:, 1::2] = torch.cos(position * div_term[:d_model // 2])
 
-        pe = pe.unsqueeze(0)
-        self.register_buffer("pe", pe)
+        # Cheap to rebuild, so keep the (1, max_len, d_model) table out of checkpoints
+        self.register_buffer("pe", pe.unsqueeze(0), persistent=False)
 
     def forward(self, x):
-        x = x + Variable(self.pe[:, :x.size(1), :], requires_grad=False)
-        return self.dropout(x)
+        return self.dropout(x + self.pe[:, :x.size(1)])
 
 
 class FNetHybridModel(nn.Module):
@@ -196,20 +208,20 @@ class FNetHybridModel(nn.Module):
         self.fnet = fnet
         self.conv = conv 
 
-    def forward(self, src, src_mask=None):
+    def forward(self, src):
         src = self.conv(src)
-        output = F.relu(self.linear(self.fnet(
-            self.trans(self.src_embed(src), src_mask))))
+        output = self.linear(self.fnet(
+            self.trans(self.src_embed(src))))
         return output
 
 
 class FNetEncoder(nn.Module):
-    "Core Fnet is a stack of N layers"
+    "Core Fnet is a stack of N layers, each freshly built by layer_fn"
 
-    def __init__(self, layer, N):
+    def __init__(self, layer_fn, N, size):
         super().__init__()
-        self.layers = clones(layer, N)
-        self.norm = LayerNorm(layer.size)
+        self.layers = nn.ModuleList([layer_fn() for _ in range(N)])
+        self.norm = LayerNorm(size)
 
     def forward(self, x):
         "Pass the input through each layer in turn"
@@ -228,125 +240,113 @@ class FNetEncoderLayer(nn.Module):
         super().__init__()
         self.fft = fft
         self.feed_forward = feed_forward
-        self.sublayer = clones(SublayerConnection(size, dropout), 2)
+        self.sublayer = nn.ModuleList([SublayerConnection(size, dropout) for _ in range(2)])
         self.size = size
 
     def forward(self, x):
-        x = self.sublayer[0](x, lambda x: self.fft(x, x, x))
+        x = self.sublayer[0](x, self.fft)
         return self.sublayer[1](x, self.feed_forward)
 
 
 class FourierFFTLayer(nn.Module):
-    def __init__(self):
-        super().__init__()
-
-    def forward(self, query, key, value):
-        assert query is key
-        assert key is value
-
-        x = query
-        return torch.real(torch.fft.fft(torch.fft.fft(x, dim=-1), dim=-2))
+    def forward(self, x):
+        # One planned 2-D transform over (seq, hidden) instead of two 1-D passes
+        return torch.fft.fft2(x, dim=(-2, -1)).real
 
 
-def create_transformer_kernel_even(N , d_model, l_win, device, kernel_size, d_ff=0, h=8, dropout=0.1):
+def init_weights(model):
+    "Xavier-init every weight matrix of a freshly built model"
+    for p in model.parameters():
+        if p.dim() > 1:
+            nn.init.xavier_uniform_(p)
+    for m in model.modules():
+        if isinstance(m, MultiHeadAttention):
+            # Packed q/k/v: give each (d_model, d_model) block its own fan,
+            # matching the separate projections it replaces
+            for w in m.qkv.weight.data.chunk(3):
+                nn.init.xavier_uniform_(w)
+        elif isinstance(m, FinalHead):
+            # Same fan as the Linear(seq_len * d_model, 1) it replaces
+            nn.init.xavier_uniform_(m.W.data.view(1, -1))
+
+
+def create_transformer_kernel_even(N , d_model, l_win, kernel_size, d_ff=0, h=8, dropout=0.1):
     if (d_ff == 0):
         d_ff = d_model * 4
-    c = copy.deepcopy
     conv = ConvLayer(d_model, kernel_size)
-    attn = MultiHeadAttention(h, d_model, device, dropout)
-    ff = PositionwiseFeedForward(d_model, d_ff, dropout)
     position = PositionalEncoding(d_model, dropout, l_win)
-    final_linear = nn.Sequential(
-        nn.Flatten(), nn.Dropout(dropout), nn.Linear(d_model * (l_win-1), 1)
-    )
+    final_linear = FinalHead(l_win - 1, d_model, dropout)
     model = TransformerModel(
-        TransformerEncoder(TransformerEncoderLayer(
-            d_model, c(attn), c(ff), dropout), N),
+        TransformerEncoder(lambda: TransformerEncoderLayer(
+            d_model, MultiHeadAttention(h, d_model, dropout),
+            PositionwiseFeedForward(d_model, d_ff, dropout), dropout), N, d_model),
         nn.Sequential(position),
         final_linear,
         conv
     )
 
-    for p in model.parameters():
-        if p.dim() > 1:
-            nn.init.xavier_uniform_(p)
+    init_weights(model)
     return model
 
 
-def create_transformer_kernel_odd(N , d_model, l_win, device, kernel_size, d_ff=0, h=8, dropout=0.1):
+def create_transformer_kernel_odd(N , d_model, l_win, kernel_size, d_ff=0, h=8, dropout=0.1):
     if (d_ff == 0):
         d_ff = d_model * 4
-    c = copy.deepcopy
     conv = ConvLayer(d_model, kernel_size)
-    attn = MultiHeadAttention(h, d_model, device, dropout)
-    ff = PositionwiseFeedForward(d_model, d_ff, dropout)
     position = PositionalEncoding(d_model, dropout, l_win)
-    final_linear = nn.Sequential(
-        nn.Flatten(), nn.Dropout(dropout), nn.Linear(d_model * l_win, 1)
-    )
+    final_linear = FinalHead(l_win, d_model, dropout)
     model = TransformerModel(
-        TransformerEncoder(TransformerEncoderLayer(
-            d_model, c(attn), c(ff), dropout), N),
+        TransformerEncoder(lambda: TransformerEncoderLayer(
+            d_model, MultiHeadAttention(h, d_model, dropout),
+            PositionwiseFeedForward(d_model, d_ff, dropout), dropout), N, d_model),
         nn.Sequential(position),
         final_linear,
         conv
     )
 
-    for p in model.parameters():
-        if p.dim() > 1:
-            nn.init.xavier_uniform_(p)
+    init_weights(model)
     return model
 
 
-def create_fnet_hybrid_kernel_even(N, d_model, l_win, device, kernel_size, d_ff=0, h=8, dropout=0.1):
+def create_fnet_hybrid_kernel_even(N, d_model, l_win, kernel_size, d_ff=0, h=8, dropout=0.1):
     if (d_ff == 0):
         d_ff = d_model * 4
-    c = copy.deepcopy
     conv = ConvLayer(d_model, kernel_size)
-    attn = MultiHeadAttention(h, d_model, device, dropout)
-    ff = PositionwiseFeedForward(d_model, d_ff, dropout)
     position = PositionalEncoding(d_model, dropout, l_win)
-    final_linear = nn.Sequential(
-        nn.Flatten(), nn.Dropout(dropout), nn.Linear(d_model * (l_win-1), 1)
-    )
-    fft = FourierFFTLayer()
+    final_linear = FinalHead(l_win - 1, d_model, dropout)
     model = FNetHybridModel(
-        TransformerEncoder(TransformerEncoderLayer(
-            d_model, c(attn), c(ff), dropout), 1),
+        TransformerEncoder(lambda: TransformerEncoderLayer(
+            d_model, MultiHeadAttention(h, d_model, dropout),
+            PositionwiseFeedForward(d_model, d_ff, dropout), dropout), 1, d_model),
         nn.Sequential(position),
         final_linear,
-        FNetEncoder(FNetEncoderLayer(d_model, c(fft), c(ff), dropout), N - 1), 
+        FNetEncoder(lambda: FNetEncoderLayer(
+            d_model, FourierFFTLayer(),
+            PositionwiseFeedForward(d_model, d_ff, dropout), dropout), N - 1, d_model),
         conv
     )
 
-    for p in model.parameters():
-        if p.dim() > 1:
-            nn.init.xavier_uniform_(p)
+    init_weights(model)
     return model
 
 
-def create_fnet_hybrid_kernel_odd(N, d_model, l_win, device, kernel_size, d_ff=0, h=8, dropout=0.1):
+def create_fnet_hybrid_kernel_odd(N, d_model, l_win, kernel_size, d_ff=0, h=8, dropout=0.1):
     if (d_ff == 0):
         d_ff = d_model * 4
-    c = copy.deepcopy
     conv = ConvLayer(d_model, kernel_size)
-    attn = MultiHeadAttention(h, d_model, device, dropout)
-    ff = PositionwiseFeedForward(d_model, d_ff, dropout)
     position = PositionalEncoding(d_model, dropout, l_win)
-    final_linear = nn.Sequential(
-        nn.Flatten(), nn.Dropout(dropout), nn.Linear(d_model * l_win, 1)
-    )
-    fft = FourierFFTLayer()
+    final_linear = FinalHead(l_win, d_model, dropout)
     model = FNetHybridModel(
-        TransformerEncoder(TransformerEncoderLayer(
-            d_model, c(attn), c(ff), dropout), 1),
+        TransformerEncoder(lambda: TransformerEncoderLayer(
+            d_model, MultiHeadAttention(h, d_model, dropout),
+            PositionwiseFeedForward(d_model, d_ff, dropout), dropout), 1, d_model),
         nn.Sequential(position),
         final_linear,
-        FNetEncoder(FNetEncoderLayer(d_model, c(fft), c(ff), dropout), N - 1), 
+        FNetEncoder(lambda: FNetEncoderLayer(
+            d_model, FourierFFTLayer(),
+            PositionwiseFeedForward(d_model, d_ff, dropout), dropout), N - 1, d_model),
         conv
     )
 
-    for p in model.parameters():
-        if p.dim() > 1:
-            nn.init.xavier_uniform_(p)
+    init_weights(model)
     return model
@@ -0,0 +1,76 @@
+import argparse
+import gc
+import glob
+import os
+import time
+
+import torch
+
+from dataloader import TimeSeriesDataset
+from train import fit
+from utils import create_dirs, process_config
+
+
+def get_sweep_args():
+    argparser = argparse.ArgumentParser(description="Train every config in a directory in one process")
+    argparser.add_argument('-d', '--config_dir',
+                           default='configs',
+                           help='directory holding the YAML configuration files')
+    argparser.add_argument('filters',
+                           nargs='*',
+                           help='only run configs whose path contains all of these substrings')
+    return argparser.parse_args()
+
+
+def main():
+    start = time.perf_counter()
+    args = get_sweep_args()
+
+    config_paths = [path for path in sorted(glob.glob(os.path.join(args.config_dir, "*.yml")))
+                    if all(sub in path for sub in args.filters)]
+    print(f"SWEEPING {len(config_paths)} CONFIGS ...")
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    # Only the dataset id and window length shape the training windows,
+    # so build each distinct dataset once and share it across configs
+    datasets = {}
+
+    failed = []
+    for path in config_paths:
+        print("Training with config {}".format(path))
+        # Like train_script.sh, a failing config is reported and the sweep moves on
+        try:
+            config = process_config(path)
+            create_dirs(config["result_dir"], config["model_dir"])
+
+            key = (config['dataset'], config['l_win'])
+            if key not in datasets:
+                datasets[key] = TimeSeriesDataset(config, mode='train')
+
+            # Same seed as a standalone train.py run of this config
+            torch.manual_seed(42)
+            fit(config, datasets[key], device)
+        except Exception as Ex:
+            print(Ex)
+            print("ERROR: Training failed for config {}".format(path))
+            failed.append(path)
+        finally:
+            # Drop compiled graphs, guards and CUDA-graph pools from this run so
+            # later configs don't hit the recompile limit and fall back to eager
+            torch._dynamo.reset()
+            gc.collect()
+            if device.type == "cuda":
+                torch.cuda.empty_cache()
+
+    if failed:
+        print("{} of {} configs failed:".format(len(failed), len(config_paths)))
+        for path in failed:
+            print("  {}".format(path))
+    print('DONE.')
+    total = (time.perf_counter() - start) / 60
+    print('Sweep time: {}'.format(total))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,35 +11,17 @@ from model import create_transformer_kernel_odd, create_transformer_kernel_even,
 from utils import save_config, get_args, create_dirs, process_config
 
 torch.manual_seed(42)
+# Input shapes are fixed per run, so let cuDNN pick the fastest conv algorithm once
+torch.backends.cudnn.benchmark = True
+torch.set_float32_matmul_precision("high")
 
 
-def main():
-    start = time.perf_counter()
-
-    try:
-        args = get_args()
-        config = process_config(args.config)
-    except Exception as Ex:
-        print(Ex)
-        print("ERROR: Missing or invalid config file.")
-        sys.exit(1)
-
-    create_dirs(config["result_dir"], config["model_dir"])
-
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-    train_data = TimeSeriesDataset(config, mode='train')
-    train_loader = DataLoader(train_data,
-                              batch_size=config['batch_size'],
-                              shuffle=True,
-                              num_workers=config['num_workers'])
-
+def create_model(config):
     if config['model'] == 1:
         if (config['kernel_size'] % 2 == 0): 
             model = create_transformer_kernel_even(N=config['num_layers'],
                                             d_model=config['d_model'],
                                             l_win=config['l_win'],
-                                            device=None,
                                             kernel_size=config['kernel_size'],
                                             d_ff=config['dff'],
                                             h=config['n_head'],
@@ -49,7 +31,6 @@ def main():
             model = create_transformer_kernel_odd(N=config['num_layers'],
                                             d_model=config['d_model'],
                                             l_win=config['l_win'],
-                                            device=None,
                                             kernel_size=config['kernel_size'],
                                             d_ff=config['dff'],
                                             h=config['n_head'],
@@ -60,7 +41,6 @@ def main():
             model = create_fnet_hybrid_kernel_even(N=config['num_layers'],
                                             d_model=config['d_model'],
                                             l_win=config['l_win'],
-                                            device=None,
                                             kernel_size=config['kernel_size'],
                                             d_ff=config['dff'],
                                             h=config['n_head'],
@@ -70,21 +50,69 @@ def main():
             model = create_fnet_hybrid_kernel_odd(N=config['num_layers'],
                                             d_model=config['d_model'],
                                             l_win=config['l_win'],
-                                            device=None,
                                             kernel_size=config['kernel_size'],
                                             d_ff=config['dff'],
                                             h=config['n_head'],
                                             dropout=config['dropout'])
+    return model
+
+
+def fit(config, train_data, device):
+    """Train one model on an already-built dataset and save its results"""
+    # Prefer bf16 autocast; fall back to fp16 on GPUs without bf16 support
+    amp_dtype = torch.bfloat16
+    if device.type == "cuda" and not torch.cuda.is_bf16_supported():
+        amp_dtype = torch.float16
+
+    # Keep workers alive across epochs and overlap H2D copies with compute;
+    # drop_last keeps batch shapes static for the compiled model
+    train_loader = DataLoader(train_data,
+                              batch_size=config['batch_size'],
+                              shuffle=True,
+                              num_workers=config['num_workers'],
+                              pin_memory=(device.type == 'cuda'),
+                              persistent_workers=config['num_workers'] > 0,
+                              prefetch_factor=4 if config['num_workers'] > 0 else None,
+                              drop_last=True)
+
+    model = create_model(config)
+
+    # Place the model once, then compile in place so state_dict keys
+    # (and saved checkpoints) stay unprefixed. Set "compile: false" in the
+    # config to train eagerly (no compile support, or very short runs).
+    model = model.to(device)
+    if config.get('compile', True):
+        model.compile(mode="reduce-overhead", fullgraph=False)
 
     optimizer = torch.optim.Adam(model.parameters(), lr=config["lr"], weight_decay=config['weight_decay'])
     criterion = nn.MSELoss()
-    trainer = ModelTrainer(model, train_loader, criterion, optimizer, device, config)
+    trainer = ModelTrainer(model, train_loader, criterion, optimizer, device, config, amp_dtype=amp_dtype)
 
     trainer.train()
     config = trainer.update_config()
 
     save_config(config['result_dir'] + "result_lr_{}_l_win_{}_dff_{}.yml".format(
         config['lr'], config['l_win'], config['dff']), config)
+    return config
+
+
+def main():
+    start = time.perf_counter()
+
+    try:
+        args = get_args()
+        config = process_config(args.config)
+    except Exception as Ex:
+        print(Ex)
+        print("ERROR: Missing or invalid config file.")
+        sys.exit(1)
+
+    create_dirs(config["result_dir"], config["model_dir"])
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    train_data = TimeSeriesDataset(config, mode='train')
+    fit(config, train_data, device)
 
     print('DONE.')
     total = (time.perf_counter() - start) / 60
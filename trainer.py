@@ -2,7 +2,7 @@ import torch
 from copy import deepcopy
 
 class ModelTrainer():
-    def __init__(self, model, train_data, criterion, optimizer, device, config):
+    def __init__(self, model, train_data, criterion, optimizer, device, config, amp_dtype=None):
         self.model = model
         self.train_data = train_data
         self.device = device
@@ -13,16 +13,22 @@ class ModelTrainer():
         self.best_optimizer = None
         self.optimizer = optimizer
         self.criterion = criterion
+        # Mixed precision: bf16 runs without loss scaling, fp16 needs a GradScaler
+        self.amp_dtype = amp_dtype
+        self.scaler = torch.amp.GradScaler(self.device.type, enabled=(amp_dtype == torch.float16))
 
     def train_epoch(self, epoch):
         train_loss = 0.0
         self.model.train()
         for x, rul in self.train_data:
             self.model.zero_grad()
-            out = self.model(x.to(self.device).float())
-            loss = torch.sqrt(self.criterion(out.float(), rul.to(self.device).float()))
-            loss.backward()
-            self.optimizer.step()
+            with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype,
+                                enabled=self.amp_dtype is not None):
+                out = self.model(x.to(self.device, non_blocking=True).float())
+                loss = torch.sqrt(self.criterion(out.float(), rul.to(self.device, non_blocking=True).float()))
+            self.scaler.scale(loss).backward()
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
             train_loss += loss.item()
 
         train_loss = train_loss / len(self.train_data)
@@ -35,8 +41,7 @@ class ModelTrainer():
             self.best_epoch_in_round = epoch
 
     def train(self):
-        self.model.to(self.device)
-
+        # The model is expected to already live on self.device (placed once before compiling)
         for epoch in range(1, self.config['n_epochs'] + 1):
             self.train_epoch(epoch)
 